@@ -0,0 +1,28 @@
+# Numba kernel for Haversine distance (one compiled, parallel loop over the whole column)
+import math
+
+import numpy as np
+from numba import njit, prange
+
+
+# fastmath without 'nnan': rows with missing coordinates must still come out as NaN
+@njit(parallel=True, fastmath={'contract', 'afn', 'arcp', 'reassoc'}, cache=True)
+def haversine_kernel(lat1, lon1, lat2, lon2, out, radius):
+    """
+    Writes distance in kilometers for every row into `out` (inputs in degrees, float64).
+    """
+    deg2rad = math.pi / 180.0
+    for i in prange(out.shape[0]):
+        phi1 = lat1[i] * deg2rad
+        phi2 = lat2[i] * deg2rad
+        dphi = phi2 - phi1
+        dlambda = (lon2[i] - lon1[i]) * deg2rad
+
+        a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+        out[i] = 2 * radius * math.asin(math.sqrt(a))
+    return out
+
+
+# Precompile at import (cache=True keeps the machine code on disk for later runs)
+_dummy = np.zeros(1, dtype=np.float64)
+haversine_kernel(_dummy, _dummy, _dummy, _dummy, np.empty(1, dtype=np.float64), 6371.0)
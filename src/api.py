@@ -1,6 +1,7 @@
 from typing import List
 from contextlib import asynccontextmanager
 
+import numpy as np
 import pandas as pd
 from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
@@ -82,14 +83,14 @@ class PredictionEngine:
 
         data = payload.dict()
         data["is_weekend_order"] = 1 if data["is_weekend_order"] else 0
-        candidate = pd.DataFrame([data])
 
         try:
-            candidate = candidate[self.features]
+            # One float32 row in model feature order (no DataFrame round-trip)
+            candidate = np.array([[data[name] for name in self.features]], dtype=np.float32)
         except KeyError as exc:
             raise RuntimeError(f"Payload missing expected feature: {exc}") from exc
 
-        prediction = self.model.predict(candidate)
+        prediction = self.model.inplace_predict(candidate)
         return float(prediction[0])
 
     def describe_warnings(self, payload: DeliveryEstimateRequest) -> List[str]:
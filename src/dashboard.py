@@ -1,17 +1,21 @@
 import os
+import atexit
 import streamlit as st
 import httpx
 import pandas as pd
+import numpy as np
 import plotly.express as px
-from src.loader import get_data
+import pydeck as pdk
+from src.loader import get_data, get_dataset_path, dataset_hash
 from src.processing import process_data
-from src.prediction import train_and_evaluate
+from src.prediction import (train_and_evaluate, feature_importances, save_trained, load_trained,
+                            skip_final_refit, training_config_hash)
 from src.model import IsolationForestModel
 
 
 API_BASE_URL = os.environ.get("DELIVERY_API_URL", "http://localhost:8000")
-PREDICTION_ENDPOINT = f"{API_BASE_URL}/predict"
 PREDICTION_TIMEOUT = 10.0
+MODEL_CACHE_DIR = "cache"
 
 # --- 1. PAGE CONFIGURATION ---
 st.set_page_config(
@@ -39,10 +43,21 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_api_client():
+    """Shared httpx client, so connections to the API are reused between clicks and reruns."""
+    client = httpx.Client(
+        base_url=API_BASE_URL,
+        timeout=PREDICTION_TIMEOUT,
+        transport=httpx.HTTPTransport(retries=3),
+    )
+    atexit.register(client.close)
+    return client
+
 def call_prediction_api(payload):
     """Call FastAPI prediction endpoint with httpx library."""
     try:
-        response = httpx.post(PREDICTION_ENDPOINT, json=payload, timeout=PREDICTION_TIMEOUT)
+        response = get_api_client().post("/predict", json=payload)
         response.raise_for_status()
     except httpx.HTTPStatusError as exc:
         st.error(f"Prediction API error ({exc.response.status_code}): {exc.response.text}")
@@ -58,23 +73,84 @@ def call_prediction_api(payload):
 @st.cache_resource
 def load_system():
     with st.spinner('🚀 Starting AI engine...'):
-        # 1. Data
-        raw_data = get_data()
-        df = process_data(raw_data)
-        
-        # 2. Anomalies
-        df = IsolationForestModel(df)
-        
-        # 3. Training - Receive 5 elements (as returned by prediction.py)
-        final_df, model, r2, mae, features = train_and_evaluate(df)
+        # 0. Results trained on the same data and config earlier?
+        # (keyed by hash of raw CSVs + hash of training configuration)
+        path = get_dataset_path()
+        skip_refit = skip_final_refit()
+        cache_key = f"{dataset_hash(path)}-{training_config_hash(skip_refit)}"
+        cache_dir = os.path.join(MODEL_CACHE_DIR, cache_key)
+        cached = load_trained(cache_dir)
+
+        if cached is not None:
+            final_df, model, r2, mae, features = cached
+        else:
+            # 1. Data
+            raw_data = get_data(path)
+            df = process_data(raw_data)
+            
+            # 2. Anomalies
+            df = IsolationForestModel(df)
+            
+            # 3. Training - Receive 5 elements (as returned by prediction.py)
+            final_df, model, r2, mae, features = train_and_evaluate(df, skip_refit=skip_refit)
+            # Cache is best effort - a failed write must not discard the trained model
+            try:
+                save_trained(cache_dir, final_df, model, r2, mae, features)
+            except OSError as exc:
+                print(f">>> [Dashboard] Could not save model cache to {cache_dir}: {exc}")
         
         # 4. Calculate biz_acc HERE (in dashboard)
-        final_df['abs_error'] = abs(final_df['delivery_time_days'] - final_df['predicted_days'])
-        biz_acc = (final_df['abs_error'] < 3).mean()
+        abs_error = np.abs(final_df['delivery_time_days'].to_numpy() - final_df['predicted_days'].to_numpy())
+        biz_acc = float((abs_error < 3).mean())
         
     # Return 6 things (5 from model + 1 calculated here)
     return final_df, model, r2, mae, features, biz_acc
 
+@st.cache_data
+def anomaly_sample(_df, df_id, n=2000):
+    """Anomaly coordinates sampled once per loaded frame (df_id is the cache key)."""
+    sub = _df.loc[_df['is_anomaly'], ['customer_lat', 'customer_lng']]
+    # 4 decimals (~10 m) is plenty for 20 km dots and keeps the map JSON small
+    return sub.sample(min(n, len(sub)), random_state=0).round(4)
+
+@st.cache_resource
+def make_deck(_pts, df_id):
+    """Anomalies map as a deck.gl scatter layer, built once per loaded frame."""
+    layer = pdk.Layer(
+        'ScatterplotLayer',
+        data=_pts,
+        get_position='[customer_lng, customer_lat]',
+        get_radius=20000,
+        get_fill_color=[255, 0, 0, 160],  # Red dots
+        pickable=False,
+    )
+    # Centered on Brazil
+    view = pdk.ViewState(latitude=-14, longitude=-51, zoom=3)
+    return pdk.Deck(layers=[layer], initial_view_state=view)
+
+@st.cache_resource
+def build_feat_fig(_model, model_id, feature_names):
+    """Feature importance chart, built once per trained model (model_id is the cache key)."""
+    # Extract feature importance from XGBoost model
+    importances = feature_importances(_model, list(feature_names))
+    
+    # Create DataFrame for chart
+    feat_df = pd.DataFrame({
+        'Feature': feature_names,
+        'Importance': importances
+    }).sort_values(by='Importance', ascending=True)  # Sort ascending for horizontal chart
+    
+    # Plotly chart
+    return px.bar(
+        feat_df, 
+        x='Importance', 
+        y='Feature', 
+        orientation='h',
+        title="Impact of variables on delivery time (XGBoost Feature Importance)",
+        color='Importance',
+        color_continuous_scale='Blues'
+    )
+
 # Start loading
 try:
     df, model, r2, mae, features, biz_acc = load_system()
@@ -209,24 +285,18 @@ with tab_map:
     col_m1, col_m2 = st.columns([3, 1])
     with col_m1:
         st.subheader("Geographic Distribution of Anomalies")
-        # Filter only anomalies
-        anomalies_df = df[df['is_anomaly'] == True]
+        # Sample 2000 anomaly points so map doesn't lag (cached between reruns)
+        anomalies_df = anomaly_sample(df, id(df))
+        num_anomalies = int(df['is_anomaly'].sum())
         
         if not anomalies_df.empty:
-            # Sample 2000 points so map doesn't lag
-            st.map(
-                anomalies_df.sample(min(2000, len(anomalies_df))),
-                latitude='customer_lat',
-                longitude='customer_lng',
-                size=20,
-                color='#ff0000'  # Red dots
-            )
+            st.pydeck_chart(make_deck(anomalies_df, id(df)))
         else:
             st.warning("No anomalies to display.")
             
     with col_m2:
         st.markdown("### Statistics")
-        st.write(f"Total anomalies: **{len(anomalies_df)}**")
+        st.write(f"Total anomalies: **{num_anomalies}**")
         st.write("Anomalies are orders that are atypical (e.g., very long delivery time for short distance).")
 
 # === TAB 3: XAI (FEATURE IMPORTANCE) ===
@@ -234,29 +304,6 @@ with tab_xai:
     st.subheader("What affects delivery time?")
     st.markdown("The chart below shows which factors are most important for the AI model.")
     
-    # Extract feature importance from XGBoost model
-    importances = model.feature_importances_
-    # Get feature names
-    feature_names = ['product_weight_g', 'product_vol_cm3', 'distance_km', 'customer_lat', 'customer_lng',
-                'seller_lat', 'seller_lng', 'payment_lag_days', 'is_weekend_order', 'freight_value',
-                'purchase_month']
-    
-    # Create DataFrame for chart
-    feat_df = pd.DataFrame({
-        'Feature': feature_names,
-        'Importance': importances
-    }).sort_values(by='Importance', ascending=True)  # Sort ascending for horizontal chart
-    
-    # Plotly chart
-    fig = px.bar(
-        feat_df, 
-        x='Importance', 
-        y='Feature', 
-        orientation='h',
-        title="Impact of variables on delivery time (XGBoost Feature Importance)",
-        color='Importance',
-        color_continuous_scale='Blues'
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(build_feat_fig(model, id(model), tuple(features)), use_container_width=True)
     
     st.info("💡 **Conclusion:** Distance and Seasonality (Month) are key factors. Package physics has less impact.")
\ No newline at end of file
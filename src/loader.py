@@ -1,34 +1,136 @@
 import pandas as pd
 import kagglehub
 import os
+import sys
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-def get_data():
+# Bump whenever USECOLS / DTYPES change, so old Parquet copies are not reused
+PARQUET_SCHEMA_VERSION = 1
+
+# Only the columns process_data actually uses
+USECOLS = {
+    "orders": ['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp',
+               'order_approved_at', 'order_delivered_customer_date'],
+    "items": ['order_id', 'product_id', 'seller_id', 'freight_value'],
+    "products": ['product_id', 'product_weight_g', 'product_length_cm', 'product_height_cm',
+                 'product_width_cm'],
+    "customers": ['customer_id', 'customer_zip_code_prefix'],
+    "sellers": ['seller_id', 'seller_zip_code_prefix'],
+    "locations": ['geolocation_zip_code_prefix', 'geolocation_lat', 'geolocation_lng'],
+}
+
+# Explicit types, so pandas skips type inference
+# (dates stay strings, they are parsed later in process_data)
+DTYPES = {
+    "orders": {'order_id': str, 'customer_id': str, 'order_status': 'category',
+               'order_purchase_timestamp': str, 'order_approved_at': str,
+               'order_delivered_customer_date': str},
+    "items": {'order_id': str, 'product_id': str, 'seller_id': str, 'freight_value': 'float32'},
+    "products": {'product_id': str, 'product_weight_g': 'float32', 'product_length_cm': 'float32',
+                 'product_height_cm': 'float32', 'product_width_cm': 'float32'},
+    "customers": {'customer_id': str, 'customer_zip_code_prefix': 'int32'},
+    "sellers": {'seller_id': str, 'seller_zip_code_prefix': 'int32'},
+    "locations": {'geolocation_zip_code_prefix': 'int32', 'geolocation_lat': 'float64',
+                  'geolocation_lng': 'float64'},
+}
+
+FILES_TO_LOAD = {"orders" : "olist_orders_dataset.csv",
+                 "items" : "olist_order_items_dataset.csv",
+                 "products" : "olist_products_dataset.csv",
+                 "customers" : "olist_customers_dataset.csv",
+                 "sellers" : "olist_sellers_dataset.csv",
+                 "locations" : "olist_geolocation_dataset.csv",
+                 }
+
+def get_dataset_path():
     """
-    Downloads dataset path and then loads files manually.
+    Downloads dataset (files only) and returns the folder path.
     """
     print(">>> [Loader] Downloading dataset (files only)...")
     
-    # 1. Get ONLY the folder path (without trying to load into table)
+    # Get ONLY the folder path (without trying to load into table)
     path = kagglehub.dataset_download("olistbr/brazilian-ecommerce")
     
     print(f">>> Dataset located at: {path}")
-    
+    return path
 
-    dfs={}
-    files_to_load = {"orders" : "olist_orders_dataset.csv",
-                    "items" : "olist_order_items_dataset.csv",
-                    "products" : "olist_products_dataset.csv",
-                    "customers" : "olist_customers_dataset.csv",
-                    "sellers" : "olist_sellers_dataset.csv",
-                    "locations" : "olist_geolocation_dataset.csv",
-                    }
-    for key, file_name in files_to_load.items():
-        csv_path = os.path.join(path, file_name)
-        print(f">>> Loading file: {csv_path}")
+def dataset_hash(path):
+    """
+    Short SHA-1 of the raw CSV files - changes whenever the input data changes.
+    """
+    digest = hashlib.sha1()
+    for file_name in FILES_TO_LOAD.values():
+        with open(os.path.join(path, file_name), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def _log(message):
+    """
+    Prints one line with a single write, so lines from loader threads don't interleave.
+    """
+    sys.stdout.write(message + "\n")
+
+def _read(path, key, file_name):
+    """
+    Loads one dataset file (Parquet copy if present, otherwise the CSV).
+    """
+    csv_path = os.path.join(path, file_name)
+    # Parquet copies live next to the CSVs in kagglehub's download folder
+    # (removed together with the dataset; skipped if the folder is read-only)
+    parquet_path = os.path.join(path, f"{key}.v{PARQUET_SCHEMA_VERSION}.parquet")
+
+    # Parquet copy from an earlier run is much faster to read than the CSV
+    # (only if written after the CSV was downloaded)
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        _log(f">>> Loading file: {parquet_path}")
         try:
-            dfs[key] = pd.read_csv(csv_path)
-        except UnicodeDecodeError:
-            print(f">>> UTF-8 encoding error in {file_name}. Trying 'latin-1'...")
-            dfs[key] = pd.read_csv(csv_path, encoding="latin-1")
+            # Same dtypes as the CSV path, whatever schema is on disk
+            return pd.read_parquet(parquet_path, engine="pyarrow", columns=USECOLS[key]).astype(DTYPES[key])
+        except ValueError:
+            _log(f">>> {parquet_path} does not match expected columns. Reading CSV instead...")
+
+    _log(f">>> Loading file: {csv_path}")
+    read_options = dict(usecols=USECOLS[key], dtype=DTYPES[key], engine="pyarrow")
+    try:
+        df = pd.read_csv(csv_path, **read_options)
+    except UnicodeDecodeError:
+        _log(f">>> UTF-8 encoding error in {file_name}. Trying 'latin-1'...")
+        df = pd.read_csv(csv_path, encoding="latin-1", **read_options)
+
+    # Convert once, next starts read the Parquet copy
+    _write_parquet(df, parquet_path)
+    return df
+
+def _write_parquet(df, parquet_path):
+    """
+    Best-effort Parquet cache write. Goes through a temporary file + os.replace,
+    so processes loading the dataset at the same time never see a half-written copy.
+    """
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(parquet_path), suffix=".parquet.tmp")
+        os.close(fd)
+        df.to_parquet(tmp_path, engine="pyarrow", compression="snappy", index=False)
+        os.replace(tmp_path, parquet_path)
+    except OSError as exc:
+        _log(f">>> Could not cache {parquet_path} ({exc}). Continuing without Parquet copy.")
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def get_data(path=None):
+    """
+    Downloads dataset path and then loads files manually.
+    """
+    if path is None:
+        path = get_dataset_path()
+
+    # Read all files at once (parsing releases the GIL, so threads overlap)
+    with ThreadPoolExecutor(max_workers=len(FILES_TO_LOAD)) as pool:
+        futures = {key: pool.submit(_read, path, key, file_name)
+                   for key, file_name in FILES_TO_LOAD.items()}
+        dfs = {key: future.result() for key, future in futures.items()}
     
-    return dfs
\ No newline at end of file
+    return dfs
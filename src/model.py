@@ -2,7 +2,6 @@
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
         
 def IsolationForestModel(df):
     # Learning based on V (volume) and W (weight)
@@ -14,13 +13,12 @@ def IsolationForestModel(df):
     'freight_value',
 ]
 
-    X=df[features].copy()
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    iso_forest = IsolationForest(contamination=0.01, random_state=42,n_estimators=100)
-    iso_forest.fit(X_scaled)
+    # No scaling needed - trees split each feature on its own range
+    X = df[features].to_numpy(dtype=np.float32, copy=False)
+    iso_forest = IsolationForest(contamination=0.01, random_state=42, n_estimators=100, n_jobs=-1)
+    labels = iso_forest.fit_predict(X)
 
-    df['is_anomaly'] = iso_forest.predict(X_scaled) == -1
+    df['is_anomaly'] = np.equal(labels, -1)
 
     # Display results
     num_anomalies = df['is_anomaly'].sum()
@@ -1,27 +1,78 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
 import pandas as pd
+import numpy as np
 import xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import r2_score, mean_absolute_error
 
-def train_and_evaluate(df):
+# --- FEATURE CONFIGURATION ---
+# Columns the model will learn from.
+FEATURES = ['product_weight_g', 'product_vol_cm3', 'distance_km', 'customer_lat', 'customer_lng',
+            'seller_lat', 'seller_lng', 'payment_lag_days', 'is_weekend_order', 'freight_value',
+            'purchase_month']
+TARGET = 'delivery_time_days'
+
+# XGBoost configuration
+XGB_PARAMS = {
+    'learning_rate': 0.05,  # Learn slowly and accurately
+    'max_depth': 6,         # Tree depth
+    'tree_method': 'hist',
+    'device': 'cpu',
+    'max_bin': 256,
+    'seed': 42,
+}
+
+# Bump when anything else that shapes saved results changes
+# (process_data, IsolationForestModel, training rounds, ...)
+CACHE_VERSION = 1
+
+def skip_final_refit():
+    """
+    True when SKIP_FINAL_REFIT=1 is set: reuse the Phase 1 model (trained on 80% of data)
+    instead of training a second model on all data - roughly halves training time.
+    """
+    return os.environ.get("SKIP_FINAL_REFIT", "0") == "1"
+
+def train_and_evaluate(df, skip_refit=None):
     """
     Main function controlling prediction.
     Performs two steps:
     1. Evaluation (Check quality on data subset).
-    2. Final Training (Train model on all data).
+    2. Final Training (Train model on all data), unless skip_refit is set -
+       then the Phase 1 model is returned. Defaults to SKIP_FINAL_REFIT env variable.
     """
     print(">>> [Prediction] Starting prediction module (XGBoost)...")
 
-    # --- FEATURE CONFIGURATION ---
-    # Columns the model will learn from.
-    features = ['product_weight_g', 'product_vol_cm3', 'distance_km', 'customer_lat', 'customer_lng',
-                'seller_lat', 'seller_lng', 'payment_lag_days', 'is_weekend_order', 'freight_value',
-                'purchase_month']
-    target = 'delivery_time_days'   
+    if skip_refit is None:
+        skip_refit = skip_final_refit()
+
+    features = list(FEATURES)
+    target = TARGET
 
     # --- DATA PREPARATION ---
     # Train only on "healthy" data (without anomalies)
-    df_clean = df[df['is_anomaly'] == False].copy()
+    # (select only the model columns, no full-frame copy)
+    mask = ~df['is_anomaly'].to_numpy()
+    df_clean = df.loc[mask, features + [target]]
+
+    # Narrow types (XGBoost works in float32 anyway, so no precision loss)
+    df_clean = df_clean.astype({
+        'product_weight_g': 'float32',
+        'product_vol_cm3': 'float32',
+        'distance_km': 'float32',
+        'customer_lat': 'float32',
+        'customer_lng': 'float32',
+        'seller_lat': 'float32',
+        'seller_lng': 'float32',
+        'freight_value': 'float32',
+        'payment_lag_days': 'int16',
+        'is_weekend_order': 'int8',
+        'purchase_month': 'int8',
+    })
     
     X = df_clean[features]
     y = df_clean[target]
@@ -34,26 +85,24 @@ def train_and_evaluate(df):
     # Split: 80% for training, 20% for testing
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-    # XGBoost configuration for testing
-    model_test = xgb.XGBRegressor(
-        n_estimators=1000,      # High limit
-        learning_rate=0.05,     # Learn slowly and accurately
-        max_depth=6,            # Tree depth
-        random_state=42,
-        n_jobs=-1,
-        early_stopping_rounds=50  # Overfitting protection!
-    )
+    # Bin the features once (test set reuses the training bins)
+    dtrain = xgb.QuantileDMatrix(X_train, y_train, max_bin=256)
+    dtest = xgb.QuantileDMatrix(X_test, y_test, ref=dtrain)
+
+    params = dict(XGB_PARAMS)
 
     # Train with test set monitoring
-    model_test.fit(
-        X_train, y_train,
-        eval_set=[(X_test, y_test)],
-        verbose=False
+    model_test = xgb.train(
+        params, dtrain,
+        num_boost_round=1000,       # High limit
+        evals=[(dtest, 'test')],
+        early_stopping_rounds=50,   # Overfitting protection!
+        verbose_eval=False
     )
 
     # Test results
-    best_rounds = model_test.best_iteration  # How many rounds were optimal?
-    y_pred = model_test.predict(X_test)
+    best_rounds = model_test.best_iteration + 1  # How many rounds were optimal?
+    y_pred = model_test.predict(dtest, iteration_range=(0, best_rounds))
     r2 = r2_score(y_test, y_pred)
     mae = mean_absolute_error(y_test, y_pred)
 
@@ -65,27 +114,97 @@ def train_and_evaluate(df):
     # ==========================================
     # STEP 2: FINAL TRAINING (On 100% data)
     # ==========================================
-    print("    Phase 2: Training final model on full dataset...")
-
-    final_model = xgb.XGBRegressor(
-        n_estimators=best_rounds,  # Use number discovered in Phase 1
-        learning_rate=0.05,
-        max_depth=6,
-        random_state=42,
-        n_jobs=-1
-    )
+    if skip_refit:
+        print("    Phase 2: Skipped, reusing Phase 1 model...")
+
+        # Keep only the optimal trees (drop the ones after early stopping point)
+        final_model = model_test[:best_rounds]
+    else:
+        print("    Phase 2: Training final model on full dataset...")
 
-    # Train on EVERYTHING (X, y), not just X_train
-    final_model.fit(X, y)
+        # Train on EVERYTHING (X, y), not just X_train
+        # Use number of rounds discovered in Phase 1
+        final_model = xgb.train(params, xgb.QuantileDMatrix(X, y, max_bin=256), num_boost_round=best_rounds)
 
     # ==========================================
     # STEP 3: PREDICTION FOR ENTIRE TABLE
     # ==========================================
     # Add predictions to original table
-    df['predicted_days'] = final_model.predict(df[features])
-    df['prediction_error'] = df['delivery_time_days'] - df['predicted_days']
+    # (contiguous float32 matrix - the layout XGBoost predicts on, so no internal copy)
+    X_all = np.ascontiguousarray(df[features].to_numpy(dtype=np.float32))
+    df['predicted_days'] = final_model.inplace_predict(X_all)
 
     print(">>> [Prediction] Done. Model returned.")
     
     # Return table with results and the model itself (for later saving)
-    return df, final_model, r2, mae, features
\ No newline at end of file
+    return df, final_model, r2, mae, features
+
+
+def feature_importances(model, features):
+    """
+    Gain-based importance for each feature (sums to 1, same as XGBRegressor.feature_importances_).
+    """
+    scores = model.get_score(importance_type='gain')
+    importances = np.array([scores.get(f, 0.0) for f in features], dtype=np.float32)
+    total = importances.sum()
+    return importances / total if total > 0 else importances
+
+
+
+def training_config_hash(skip_refit=None):
+    """
+    Short SHA-1 of everything that shapes training results (params, features, refit mode, version).
+    """
+    if skip_refit is None:
+        skip_refit = skip_final_refit()
+    config = {
+        'skip_refit': skip_refit,
+        'params': XGB_PARAMS,
+        'features': FEATURES,
+        'target': TARGET,
+        'version': CACHE_VERSION,
+    }
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def save_trained(cache_dir, df, model, r2, mae, features):
+    """
+    Saves training results (table with predictions, model, metrics) to cache_dir.
+    Files are written to a temporary folder first and moved into place at once,
+    so a crash never leaves a half-written cache_dir behind.
+    """
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        model.save_model(os.path.join(tmp_dir, 'model.json'))
+        df.to_parquet(os.path.join(tmp_dir, 'final_df.parquet'), engine='pyarrow', index=False)
+        with open(os.path.join(tmp_dir, 'metrics.json'), 'w') as f:
+            json.dump({'r2': float(r2), 'mae': float(mae), 'features': list(features)}, f)
+
+        # Replace an older (unreadable) copy, if any
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load_trained(cache_dir):
+    """
+    Loads results saved by save_trained. Returns None if cache_dir is missing or unreadable.
+    """
+    paths = [os.path.join(cache_dir, name) for name in ('model.json', 'final_df.parquet', 'metrics.json')]
+    if not all(os.path.exists(p) for p in paths):
+        return None
+
+    try:
+        model = xgb.Booster()
+        model.load_model(paths[0])
+        df = pd.read_parquet(paths[1], engine='pyarrow')
+        with open(paths[2]) as f:
+            metrics = json.load(f)
+        return df, model, metrics['r2'], metrics['mae'], metrics['features']
+    except (OSError, ValueError, KeyError, xgb.core.XGBoostError) as exc:
+        print(f">>> [Prediction] Ignoring unreadable cache {cache_dir}: {exc}")
+        return None
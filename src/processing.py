@@ -1,22 +1,54 @@
 import pandas as pd
 import numpy as np
 
+try:
+    from ._haversine_nb import haversine_kernel
+except ImportError:  # numba is optional, fall back to numexpr / NumPy
+    haversine_kernel = None
+
+try:
+    import numexpr as ne
+except ImportError:  # numexpr is optional, fall back to plain NumPy
+    ne = None
+
+EARTH_RADIUS_KM = 6371
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Whole Haversine formula (including degrees -> radians) as one expression,
+# so numexpr evaluates it in a single pass over the raw coordinate arrays
+HAVERSINE_EXPR = (
+    "2 * R * arcsin(sqrt(sin((lat2 - lat1) * D / 2)**2"
+    " + cos(lat1 * D) * cos(lat2 * D) * sin((lon2 - lon1) * D / 2)**2))"
+)
+
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
     Calculates distance in kilometers between two points on Earth (Haversine Formula).
     """
-    R = 6371  # Earth radius in kilometers
+    # One-time coercion to contiguous float64 (no copy inside numba / numexpr)
+    lat1, lon1, lat2, lon2 = (np.ascontiguousarray(v, dtype=np.float64) for v in (lat1, lon1, lat2, lon2))
+
+    if haversine_kernel is not None:
+        out = np.empty_like(lat1)
+        return haversine_kernel(lat1, lon1, lat2, lon2, out, float(EARTH_RADIUS_KM))
+
+    if ne is not None:
+        out = np.empty_like(lat1)
+        return ne.evaluate(HAVERSINE_EXPR, local_dict={
+            'lat1': lat1, 'lon1': lon1,
+            'lat2': lat2, 'lon2': lon2,
+            'R': np.float64(EARTH_RADIUS_KM),
+            'D': np.float64(np.pi / 180),
+        }, out=out)
 
     # Convert degrees to radians
-    phi1, phi2 = np.radians(lat1), np.radians(lat2)
-    dphi = np.radians(lat2 - lat1)
-    dlambda = np.radians(lon2 - lon1)
+    phi1, lambda1, phi2, lambda2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
 
     # Haversine formula
-    a = np.sin(dphi / 2)**2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2)**2
+    a = np.sin((phi2 - phi1) / 2)**2 + np.cos(phi1) * np.cos(phi2) * np.sin((lambda2 - lambda1) / 2)**2
     c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
 
-    return R * c
+    return EARTH_RADIUS_KM * c
 
 def process_data(dfs):
     print(">>> [Processing] Starting feature engineering with Geolocation...")
@@ -30,10 +62,16 @@ def process_data(dfs):
 
     # STEP 1: Fix Geolocation (This is crucial!)
     # Geo table has duplicates. Group by zip code and take mean position.
+    # Aggregate only zip codes that customers or sellers actually use.
+    needed = pd.Index(pd.unique(np.concatenate([
+        customers['customer_zip_code_prefix'].unique(),
+        sellers['seller_zip_code_prefix'].unique()
+    ])))
+    geo = geo[geo['geolocation_zip_code_prefix'].isin(needed)]
     geo = geo.groupby('geolocation_zip_code_prefix').agg({
         'geolocation_lat': 'mean',
         'geolocation_lng': 'mean'
-    }).reset_index()
+    })  # Indexed by zip code prefix
 
     # STEP 2: Join Main Tables
     # Orders -> Items -> Products
@@ -47,30 +85,18 @@ def process_data(dfs):
     # Join Seller data (to get their zip code)
     main_df = main_df.merge(sellers, on='seller_id')
 
-    # STEP 3: Join Coordinates (TWICE!)
-    
-    # A. Where is the CUSTOMER? (Join on customer_zip_code_prefix)
-    main_df = main_df.merge(
-        geo, 
-        left_on='customer_zip_code_prefix', 
-        right_on='geolocation_zip_code_prefix', 
-        how='left'
-    ).rename(columns={
-        'geolocation_lat': 'customer_lat',
-        'geolocation_lng': 'customer_lng'
-    })
-
-    # B. Where is the SELLER? (Join on seller_zip_code_prefix)
-    main_df = main_df.merge(
-        geo, 
-        left_on='seller_zip_code_prefix', 
-        right_on='geolocation_zip_code_prefix', 
-        how='left',
-        suffixes=('', '_seller')  # Important to avoid name conflicts
-    ).rename(columns={
-        'geolocation_lat': 'seller_lat',
-        'geolocation_lng': 'seller_lng'
-    })
+    # STEP 3: Look up Coordinates (TWICE!)
+    # Zip code -> position lookup tables (one hashmap each, instead of two full merges)
+    geo_lat = geo['geolocation_lat']
+    geo_lng = geo['geolocation_lng']
+
+    # A. Where is the CUSTOMER? (Look up by customer_zip_code_prefix)
+    main_df['customer_lat'] = main_df['customer_zip_code_prefix'].map(geo_lat)
+    main_df['customer_lng'] = main_df['customer_zip_code_prefix'].map(geo_lng)
+
+    # B. Where is the SELLER? (Look up by seller_zip_code_prefix)
+    main_df['seller_lat'] = main_df['seller_zip_code_prefix'].map(geo_lat)
+    main_df['seller_lng'] = main_df['seller_zip_code_prefix'].map(geo_lng)
 
     # STEP 4: Calculations and Physics
     
@@ -81,10 +107,13 @@ def process_data(dfs):
 
     # STEP 4: Time and Process Calculations (Process Mining)
     
-    # Convert key dates
-    main_df['purchase_date'] = pd.to_datetime(main_df['order_purchase_timestamp'])
-    main_df['approved_date'] = pd.to_datetime(main_df['order_approved_at'])
-    main_df['delivered_date'] = pd.to_datetime(main_df['order_delivered_customer_date'])
+    # Convert key dates (fixed format - no per-row format inference)
+    main_df['purchase_date'] = pd.to_datetime(main_df['order_purchase_timestamp'], format=TIMESTAMP_FORMAT, errors='coerce')
+    main_df['approved_date'] = pd.to_datetime(main_df['order_approved_at'], format=TIMESTAMP_FORMAT, errors='coerce')
+    main_df['delivered_date'] = pd.to_datetime(main_df['order_delivered_customer_date'], format=TIMESTAMP_FORMAT, errors='coerce')
+
+    # No purchase date = no target, drop now (before the int8 casts below)
+    main_df = main_df.dropna(subset=['purchase_date'])
     
     # A. Delivery Time (Target)
     main_df['delivery_time_days'] = (main_df['delivered_date'] - main_df['purchase_date']).dt.days
@@ -94,13 +123,14 @@ def process_data(dfs):
     # Fill NaN with zeros (assume instant payment if no date)
     main_df['payment_lag_days'] = (main_df['approved_date'] - main_df['purchase_date']).dt.days.fillna(0)
     
+    purchase_dt = main_df['purchase_date'].dt
+
     # C. Weekend Effect (Day of Week)
     # 0 = Monday, 6 = Sunday
-    main_df['purchase_day_of_week'] = main_df['purchase_date'].dt.dayofweek
-    main_df['is_weekend_order'] = (main_df['purchase_day_of_week'] >= 4).astype(int)
+    main_df['is_weekend_order'] = (purchase_dt.dayofweek >= 4).astype('int8')
     
     # Purchase month
-    main_df['purchase_month'] = main_df['purchase_date'].dt.month
+    main_df['purchase_month'] = purchase_dt.month.astype('int8')
 
     # STEP 5: DISTANCE CALCULATION (Haversine)
     # We have customer_lat/lng and seller_lat/lng. Calculate distance.
@@ -110,7 +140,7 @@ def process_data(dfs):
     )
 
     # Cleanup (Remove empty rows, e.g., no delivery date)
-    # Keep only delivered orders
+    # Keep only delivered orders (order_status is categorical, so this compares integer codes)
     final_df = main_df[main_df['order_status'] == 'delivered'].dropna(subset=[
         'delivery_time_days', 'product_weight_g', 'distance_km'
     ])
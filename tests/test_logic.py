@@ -5,17 +5,50 @@ import sys
 from pathlib import Path
 from unittest.mock import Mock, patch, PropertyMock
 
+import numpy as np
+import pandas as pd
 import pytest
 from fastapi.testclient import TestClient
 
 # Add project root to Python path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from src import loader, prediction, processing
 from src.api import app
 
 client = TestClient(app)
 
 
+def make_raw_tables(n=400, seed=0):
+    """Small synthetic Olist-like tables (delivery time grows with product weight)."""
+    rng = np.random.default_rng(seed)
+    purchase = pd.Timestamp("2017-01-01") + pd.to_timedelta(rng.integers(0, 365 * 86400, n), unit="s")
+    weight = rng.uniform(100, 20000, n)
+    days = 1 + weight / 1000 + rng.uniform(0, 2, n)
+    fmt = "%Y-%m-%d %H:%M:%S"
+    ids = [str(i) for i in range(n)]
+    zips = rng.integers(1000, 1050, n)
+
+    return {
+        "orders": pd.DataFrame({
+            "order_id": ids, "customer_id": ids, "order_status": "delivered",
+            "order_purchase_timestamp": purchase.strftime(fmt),
+            "order_approved_at": (purchase + pd.Timedelta(hours=5)).strftime(fmt),
+            "order_delivered_customer_date": (purchase + pd.to_timedelta(days, unit="D")).strftime(fmt),
+        }),
+        "items": pd.DataFrame({"order_id": ids, "product_id": ids, "seller_id": ids,
+                               "freight_value": rng.uniform(5, 80, n)}),
+        "products": pd.DataFrame({"product_id": ids, "product_weight_g": weight,
+                                  "product_length_cm": 10.0, "product_height_cm": 10.0,
+                                  "product_width_cm": 10.0}),
+        "customers": pd.DataFrame({"customer_id": ids, "customer_zip_code_prefix": zips}),
+        "sellers": pd.DataFrame({"seller_id": ids, "seller_zip_code_prefix": zips[::-1]}),
+        "locations": pd.DataFrame({"geolocation_zip_code_prefix": np.arange(1000, 1050),
+                                   "geolocation_lat": rng.uniform(-30, -5, 50),
+                                   "geolocation_lng": rng.uniform(-60, -35, 50)}),
+    }
+
+
 @pytest.fixture(autouse=True)
 def mock_engine():
     """Mock the global engine instance to avoid Kaggle downloads."""
@@ -133,4 +166,171 @@ def test_prediction_endpoint_invalid_coordinates():
     }
     
     response = client.post("/predict", json=payload)
-    assert response.status_code == 422
\ No newline at end of file
+    assert response.status_code == 422
+
+
+
+@pytest.fixture(params=["numba", "numexpr", "numpy"])
+def haversine_backend(request, monkeypatch):
+    """Force haversine_distance onto one backend (Numba kernel, numexpr or plain NumPy)."""
+    if request.param == "numba" and processing.haversine_kernel is None:
+        pytest.skip("numba not installed")
+    if request.param == "numexpr" and processing.ne is None:
+        pytest.skip("numexpr not installed")
+    if request.param in ("numexpr", "numpy"):
+        monkeypatch.setattr(processing, "haversine_kernel", None)
+    if request.param == "numpy":
+        monkeypatch.setattr(processing, "ne", None)
+    return request.param
+
+
+def test_haversine_distance_sao_paulo_rio(haversine_backend):
+    """Test Haversine distance between Sao Paulo and Rio de Janeiro (~360 km)."""
+    distance = processing.haversine_distance([-23.55], [-46.63], [-22.91], [-43.17])
+    assert distance[0] == pytest.approx(361, abs=5)
+
+
+def test_haversine_distance_backends_agree(haversine_backend, monkeypatch):
+    """Test every backend matches the NumPy formula and keeps NaN for missing coordinates."""
+    lat1 = np.array([-23.55, np.nan, 0.0, -3.1])
+    lon1 = np.array([-46.63, -46.63, 0.0, -60.0])
+    lat2 = np.array([-22.91, -22.91, 0.0, np.nan])
+    lon2 = np.array([-43.17, -43.17, 1.0, -38.5])
+
+    distance = processing.haversine_distance(lat1, lon1, lat2, lon2)
+
+    monkeypatch.setattr(processing, "haversine_kernel", None)
+    monkeypatch.setattr(processing, "ne", None)
+    expected = processing.haversine_distance(lat1, lon1, lat2, lon2)
+
+    np.testing.assert_allclose(distance, expected, rtol=1e-9)
+    assert np.isnan(distance[1]) and np.isnan(distance[3])
+
+
+def test_get_data_parquet_cache_keeps_dtypes(tmp_path):
+    """Test Parquet copies are read with DTYPES and rewritten from CSV when columns are missing."""
+    for key, file_name in loader.FILES_TO_LOAD.items():
+        columns = loader.USECOLS[key]
+        pd.DataFrame({col: ["delivered" if col == "order_status" else "1"] for col in columns}).to_csv(
+            tmp_path / file_name, index=False)
+
+    first = loader.get_data(str(tmp_path))
+
+    # Old copy with a wrong dtype and a missing column
+    orders_parquet = tmp_path / f"orders.v{loader.PARQUET_SCHEMA_VERSION}.parquet"
+    first["orders"].astype(str).drop(columns="order_approved_at").to_parquet(orders_parquet)
+    # Copy with a wrong dtype only
+    customers_parquet = tmp_path / f"customers.v{loader.PARQUET_SCHEMA_VERSION}.parquet"
+    first["customers"].astype({"customer_zip_code_prefix": "int64"}).to_parquet(customers_parquet)
+
+    second = loader.get_data(str(tmp_path))
+
+    assert isinstance(second["orders"]["order_status"].dtype, pd.CategoricalDtype)
+    assert list(second["orders"].columns) == loader.USECOLS["orders"]
+    assert second["customers"]["customer_zip_code_prefix"].dtype == "int32"
+    for key in loader.FILES_TO_LOAD:
+        assert second[key].dtypes.to_dict() == first[key].dtypes.to_dict()
+
+
+def test_process_data_drops_unparseable_purchase_dates():
+    """Test rows with a malformed or missing purchase timestamp are dropped, not crashing int8 casts."""
+    raw = make_raw_tables(n=20)
+    raw["orders"].loc[0, "order_purchase_timestamp"] = "bad"
+    raw["orders"].loc[1, "order_purchase_timestamp"] = None
+
+    result = processing.process_data(raw)
+
+    assert len(result) == 18
+    assert not {"0", "1"} & set(result["order_id"])
+    assert result["purchase_month"].dtype == "int8"
+
+
+@pytest.fixture(scope="module")
+def processed_df():
+    """Processed synthetic data with no anomalies flagged."""
+    df = processing.process_data(make_raw_tables())
+    df["is_anomaly"] = False
+    return df
+
+
+def test_train_and_evaluate_final_model_rounds(processed_df):
+    """Test both Phase 2 branches return a model with the same, early-stopped number of trees."""
+    rounds = {}
+    for skip_refit in (False, True):
+        df, model, r2, mae, features = prediction.train_and_evaluate(
+            processed_df.copy(), skip_refit=skip_refit
+        )
+        rounds[skip_refit] = model.num_boosted_rounds()
+        assert df["predicted_days"].notna().all()
+        assert r2 > 0.5
+
+    assert rounds[False] == rounds[True]
+    assert 0 < rounds[False] < 1000
+
+
+def test_train_and_evaluate_reads_skip_flag_at_call_time(processed_df, monkeypatch, capsys):
+    """Test SKIP_FINAL_REFIT env variable is honoured when set after import."""
+    monkeypatch.setenv("SKIP_FINAL_REFIT", "1")
+    prediction.train_and_evaluate(processed_df.copy())
+    assert "Phase 2: Skipped" in capsys.readouterr().out
+
+
+def test_save_and_load_trained_round_trip(processed_df, tmp_path):
+    """Test saved results load back with identical table, metrics and predictions."""
+    df, model, r2, mae, features = prediction.train_and_evaluate(processed_df.copy())
+    cache_dir = tmp_path / "cache" / "key"
+
+    assert prediction.load_trained(str(cache_dir)) is None
+    prediction.save_trained(str(cache_dir), df, model, r2, mae, features)
+
+    loaded_df, loaded_model, loaded_r2, loaded_mae, loaded_features = prediction.load_trained(str(cache_dir))
+    pd.testing.assert_frame_equal(loaded_df, df.reset_index(drop=True))
+    assert (loaded_r2, loaded_mae, loaded_features) == (r2, mae, features)
+    np.testing.assert_array_equal(
+        loaded_model.inplace_predict(loaded_df[features]), model.inplace_predict(df[features])
+    )
+    # No temporary folders left next to the cache
+    assert [p.name for p in cache_dir.parent.iterdir()] == ["key"]
+
+
+def test_load_trained_ignores_truncated_cache(processed_df, tmp_path):
+    """Test a truncated metrics file is treated as a cache miss and overwritten on save."""
+    df, model, r2, mae, features = prediction.train_and_evaluate(processed_df.copy())
+    cache_dir = str(tmp_path / "key")
+    prediction.save_trained(cache_dir, df, model, r2, mae, features)
+
+    with open(tmp_path / "key" / "metrics.json", "w") as f:
+        f.write('{"r2": 0.4')
+    assert prediction.load_trained(cache_dir) is None
+
+    prediction.save_trained(cache_dir, df, model, r2, mae, features)
+    assert prediction.load_trained(cache_dir) is not None
+
+
+def test_training_config_hash_tracks_training_config(monkeypatch):
+    """Test the cache key changes with refit mode, params and cache version."""
+    base = prediction.training_config_hash(skip_refit=False)
+    assert prediction.training_config_hash(skip_refit=False) == base
+    assert prediction.training_config_hash(skip_refit=True) != base
+
+    monkeypatch.setitem(prediction.XGB_PARAMS, "max_depth", 8)
+    assert prediction.training_config_hash(skip_refit=False) != base
+    monkeypatch.undo()
+
+    monkeypatch.setattr(prediction, "CACHE_VERSION", prediction.CACHE_VERSION + 1)
+    assert prediction.training_config_hash(skip_refit=False) != base
+
+
+def test_get_data_works_when_dataset_folder_is_read_only(tmp_path, monkeypatch):
+    """Test a failed Parquet cache write is reported but does not stop loading."""
+    for key, file_name in loader.FILES_TO_LOAD.items():
+        pd.DataFrame({col: ["1"] for col in loader.USECOLS[key]}).to_csv(tmp_path / file_name, index=False)
+
+    def read_only(*args, **kwargs):
+        raise PermissionError("read-only file system")
+    monkeypatch.setattr(loader.tempfile, "mkstemp", read_only)
+
+    dfs = loader.get_data(str(tmp_path))
+
+    assert set(dfs) == set(loader.FILES_TO_LOAD)
+    assert not list(tmp_path.glob("*.parquet*"))